@@ -1,19 +1,31 @@
+import time
+STARTUP_TIME = time.perf_counter()
+
 import sys
 import os
 import json
-from PyQt6.QtWidgets import QApplication, QGridLayout, QHeaderView, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QFileDialog, QTabWidget, QTableWidget, QSizePolicy, QTableWidgetItem
+from datetime import timedelta
+from PyQt6.QtWidgets import QApplication, QGridLayout, QHeaderView, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QFileDialog, QTabWidget, QTableWidget, QSizePolicy, QTableWidgetItem, QPlainTextEdit
 from PyQt6.QtCore import pyqtSignal, Qt, QSize, QObject, QTimer, QThread
 from PyQt6 import QtGui
-import pyqtgraph as pg
-from reader import get_hand_list, get_text_files, get_player_stats
+from reader import get_hand_list, get_text_files, get_player_stats, get_source_index, get_cumulative_profits, get_table_rows, save_snapshot, load_snapshot
+from classes import HandTextCache, SessionTracker
 import ctypes
-from utils import format_card_string, get_sorted_hands, format_profit_value, format_date_string
+from utils import format_card_string, format_profit_value, format_date_string, format_duration
 
 myappid = 'ace_analytics' # arbitrary string
 ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
 
-HAND_TEXT = []
 HANDS = []
+NUM_HANDS = 0
+PROFIT_SERIES = ([], []) # x and y values of the cumulative profit graph
+TABLE_HEAD = [] # newest hands table rows from the startup snapshot, shown until the hands are parsed
+HAND_SOURCES = {}
+HAND_TEXT_CACHE = HandTextCache()
+SESSION_GAP = 30 # how many minutes without a hand before a new session starts
+SESSION_TRACKER = SessionTracker(timedelta(minutes=SESSION_GAP))
+SESSIONS = []
+SKIPPED_HANDS = {"unrecognized_files": 0, "malformed": 0} # files and hands the last refresh couldn't parse
 PLAYER_STATS = {
         "vpip": 0.,
         "best_hand": "",
@@ -26,6 +38,8 @@ PLAYER_STATS = {
 USER = ""
 DIRPATHS = []
 DATA_UPDATE_RATE = 5000 # how many ms between data updates
+TIME_STARTUP = '--time-startup' in sys.argv # print the time from launch to the first painted Dashboard frame
+PREFETCH_ROWS = 20 # how many rows around the visible ones to prefetch hand text for
 
 def update_config_data():
     global USER, DIRPATHS
@@ -34,16 +48,33 @@ def update_config_data():
         DIRPATHS = config['handHistoryDirs']
         USER = config['user']
 
+def load_startup_snapshot():
+    '''Fills the stats globals from the snapshot saved at the last shutdown so the first frame has data.'''
+    global NUM_HANDS, PROFIT_SERIES, TABLE_HEAD, PLAYER_STATS
+    if not isConfigValid(): return
+    update_config_data()
+    snapshot = load_snapshot(USER, DIRPATHS)
+    if snapshot is None: return
+    NUM_HANDS = snapshot["numHands"]
+    PROFIT_SERIES = tuple(snapshot["profits"])
+    TABLE_HEAD = snapshot["tableHead"]
+    PLAYER_STATS = snapshot["stats"]
+
 class Worker(QObject):
     finished = pyqtSignal()
 
     def run(self):
         """Long-running task."""
-        global HAND_TEXT, HANDS, PLAYER_STATS
+        global HANDS, NUM_HANDS, PROFIT_SERIES, HAND_SOURCES, PLAYER_STATS, SESSIONS, SKIPPED_HANDS
         update_config_data()
-        HAND_TEXT = get_text_files(DIRPATHS)
-        HANDS = get_hand_list(HAND_TEXT, USER)
+        skipped = {}
+        HANDS = get_hand_list(get_text_files(DIRPATHS), USER, skipped=skipped)
+        SKIPPED_HANDS = skipped
+        NUM_HANDS = len(HANDS)
+        PROFIT_SERIES = get_cumulative_profits(HANDS)
+        HAND_SOURCES = get_source_index(HANDS)
         PLAYER_STATS = get_player_stats(HANDS)
+        SESSIONS = SESSION_TRACKER.update(HANDS)
         self.finished.emit()
 
 class Config(QWidget):
@@ -115,9 +146,6 @@ class Main(QWidget):
         self.setupWorkerAndThread()
         self.setupTimer()
 
-        # Manually trigger the first data update
-        self.onTimerTimeout()
-
     def setupWorkerAndThread(self):
         self.thread = QThread()
         self.worker = Worker()
@@ -145,40 +173,84 @@ class Main(QWidget):
         
         self.dashboard = Dashboard()
         self.basic = BasicStats()
-        self.hands = HandHist()
+        self.hands = None
+        self.sessions = None
+
+        # tabs that aren't visible on startup are built the first time they are opened
+        self.lazyTabs = {
+            3: self.buildHandsTab,
+            4: self.buildSessionsTab,
+            6: lambda: QLabel("Charts"),
+        }
 
-        tabWidget = QTabWidget()
+        self.tabWidget = QTabWidget()
         sections = [
             (self.dashboard, "Dashboard"),
             (self.basic, "Basic Statistics"),
             (QLabel("Advanced Statistics"), "Advanced Statistics"),
-            (self.hands, "Hands"),
+            (QWidget(), "Hands"),
+            (QWidget(), "Sessions"),
             (QLabel("Players"), "Players"),
-            (QLabel("Charts"), "Charts"),
+            (QWidget(), "Charts"),
             (QLabel("Settings"), "Settings"),
         ]
         
         for section, title in sections:
-            tabWidget.addTab(section, title)
+            self.tabWidget.addTab(section, title)
+        self.tabWidget.currentChanged.connect(self.buildLazyTab)
         
-        mainLayout.addWidget(tabWidget)
+        mainLayout.addWidget(self.tabWidget)
+
+    def buildLazyTab(self, index):
+        if index not in self.lazyTabs: return
+        placeholder = self.tabWidget.widget(index)
+        layout = QVBoxLayout(placeholder)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.lazyTabs.pop(index)())
+
+    def buildHandsTab(self):
+        self.hands = HandHist()
+        return self.hands
+
+    def buildSessionsTab(self):
+        self.sessions = SessionList()
+        return self.sessions
 
     def updateTabs(self):
+        HAND_TEXT_CACHE.set_index(HAND_SOURCES)
         self.dashboard.updateData()
         self.basic.updateData()
-        self.hands.updateData()
+        if self.hands: self.hands.updateData()
+        if self.sessions: self.sessions.updateData()
 
     def customShow(self):
         self.show()
         if not isConfigValid():
             self.c = Config(self)
             self.c.show()
+        # the first frame is drawn from the snapshot, then the hands are refreshed in the background
+        QTimer.singleShot(0, self.onTimerTimeout)
+
+    def closeEvent(self, event):
+        if HANDS:
+            save_snapshot(HANDS, PLAYER_STATS, USER, DIRPATHS)
+        super().closeEvent(event)
              
 class Dashboard(QWidget):
     def __init__(self):
         super().__init__()
+        self.painted = False
         self.init_dashboard()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            if TIME_STARTUP:
+                print(f"First paint after {round((time.perf_counter() - STARTUP_TIME) * 1000)} ms")
+            # pyqtgraph (and NumPy with it) is only imported once the first frame is up
+            QTimer.singleShot(0, self.initGraph)
+
     def init_dashboard(self):
         layout = QVBoxLayout()
         layout.setSpacing(0)
@@ -190,13 +262,19 @@ class Dashboard(QWidget):
         self.welcomeLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.welcomeLabel)
 
-        if not HANDS:
-            self.warningLabel = QLabel(f"<h2 style=\"color: rgb(200, 0, 0); font-weight: normal;\">Warning: No hand data was found in <b>{DIRPATHS}</b></h2>")
-            self.warningLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            layout.addWidget(self.warningLabel)
+        self.warningLabel = QLabel(f"<h2 style=\"color: rgb(200, 0, 0); font-weight: normal;\">Warning: No hand data was found in <b>{DIRPATHS}</b></h2>")
+        self.warningLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.warningLabel.setVisible(NUM_HANDS == 0)
+        layout.addWidget(self.warningLabel)
+
+        self.skipped = None
+        self.skippedLabel = QLabel()
+        self.skippedLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.skippedLabel)
+        self.updateSkipped()
 
-        self.numHands = len(HANDS)
-        self.handsPlayedLabel = QLabel(f"<h2 style=\"font-weight: normal;\">You've played <b>{len(HANDS)}</b> hands so far</h2>")
+        self.numHands = NUM_HANDS
+        self.handsPlayedLabel = QLabel(f"<h2 style=\"font-weight: normal;\">You've played <b>{NUM_HANDS}</b> hands so far</h2>")
         self.handsPlayedLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.handsPlayedLabel)
 
@@ -213,30 +291,14 @@ class Dashboard(QWidget):
         self.dateLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.dateLabel)
 
-        graphLayout = QHBoxLayout()
-        self.graphWidget = pg.PlotWidget()
-        self.graphWidget.setBackground("w")
-
-        self.graphWidget.setMinimumWidth(600)
-        self.graphWidget.setMaximumWidth(800)
-
-        graphLayout.addStretch()
-        graphLayout.addWidget(self.graphWidget)
-        graphLayout.addStretch()
-
-        x = list(range(1, len(HANDS) + 1))
-        y = [0]
-        for i, hand in enumerate(HANDS, start=1):
-            y.append(y[-1] + hand.profit)
-
+        self.graphLayout = QHBoxLayout()
+        self.graphWidget = None
         self.graphStyles = {"color": "black", "font-size": "18px"}
-        self.graphWidget.setLabel("left", "Cumulative Profit ($)", **self.graphStyles)
-        self.graphWidget.setLabel("bottom", "Hands", **self.graphStyles)
-        self.graphWidget.plot(x, y[1:], pen='r', name="Cumulative Profit")
-        self.ref_pen = pg.mkPen(color=(0, 0, 0), width=1, style=Qt.PenStyle.DotLine)
-        self.graphWidget.plot(x, [0 for i in range(len(y[1:]))], pen=self.ref_pen)
 
-        layout.addLayout(graphLayout)
+        self.graphLayout.addStretch()
+        self.graphLayout.addStretch()
+
+        layout.addLayout(self.graphLayout)
 
         layout.addStretch()
         self.setLayout(layout)
@@ -247,27 +309,47 @@ class Dashboard(QWidget):
             welcomeStr = f"<h1 style=\"font-weight: normal;\">Welcome, <b>{self.user}</b></h1>" if self.user else "<h1 style=\"font-weight: normal;\">Welcome!</h1>"
             self.welcomeLabel.setText(welcomeStr)
 
-        if len(HANDS) != self.numHands:
-            prevHands = self.numHands
-            self.numHands = len(HANDS)
-            if prevHands == 0:
-                self.warningLabel.deleteLater()
-                self.warningLabel = None
-                self.handsPlayedLabel.setText(f"<h2 style=\"font-weight: normal;\">You've played <b>{len(HANDS)}</b> hands so far</h2>")
-            
-            self.handsPlayedLabel.setText(f"<h2 style=\"font-weight: normal;\">You've played <b>{len(HANDS)}</b> hands so far</h2>")
+        self.updateSkipped()
+
+        if NUM_HANDS == 0:
+            self.warningLabel.setText(f"<h2 style=\"color: rgb(200, 0, 0); font-weight: normal;\">Warning: No hand data was found in <b>{DIRPATHS}</b></h2>")
+        self.warningLabel.setVisible(NUM_HANDS == 0)
+
+        if NUM_HANDS != self.numHands:
+            self.numHands = NUM_HANDS
+            self.handsPlayedLabel.setText(f"<h2 style=\"font-weight: normal;\">You've played <b>{NUM_HANDS}</b> hands so far</h2>")
             profit = PLAYER_STATS["cprofit"]
             if profit >= 0: self.profitLabel.setText(f"<h2 style=\"font-weight: normal;\">You've made <b>${profit}</b> so far</h2>")
             else: self.profitLabel.setText(f"<h2 style=\"font-weight: normal;\">You've lost <b style=\"color: rgb(200, 0, 0);\">-${abs(profit)}</b> so far</h2>")
-            self.graphWidget.clear()
-            x = list(range(1, len(HANDS) + 1))
-            y = [0]
-            for i, hand in enumerate(HANDS, start=1):
-                y.append(y[-1] + hand.profit)
-            self.graphWidget.setLabel("left", "Cumulative Profit ($)", **self.graphStyles)
-            self.graphWidget.setLabel("bottom", "Hands", **self.graphStyles)
-            self.graphWidget.plot(x, y[1:], pen='r', name="Cumulative Profit")
-            self.graphWidget.plot(x, [0 for i in range(len(y[1:]))], pen=self.ref_pen)
+            if self.graphWidget: self.plotProfits()
+
+    def initGraph(self):
+        import pyqtgraph as pg
+
+        self.graphWidget = pg.PlotWidget()
+        self.graphWidget.setBackground("w")
+
+        self.graphWidget.setMinimumWidth(600)
+        self.graphWidget.setMaximumWidth(800)
+
+        self.graphLayout.insertWidget(1, self.graphWidget)
+        self.ref_pen = pg.mkPen(color=(0, 0, 0), width=1, style=Qt.PenStyle.DotLine)
+        self.plotProfits()
+
+    def plotProfits(self):
+        self.graphWidget.clear()
+        x, y = PROFIT_SERIES
+        self.graphWidget.setLabel("left", "Cumulative Profit ($)", **self.graphStyles)
+        self.graphWidget.setLabel("bottom", "Hands", **self.graphStyles)
+        self.graphWidget.plot(x, y, pen='r', name="Cumulative Profit")
+        self.graphWidget.plot(x, [0 for i in range(len(y))], pen=self.ref_pen)
+
+    def updateSkipped(self):
+        if SKIPPED_HANDS == self.skipped: return
+        self.skipped = SKIPPED_HANDS
+        unrecognized, malformed = SKIPPED_HANDS["unrecognized_files"], SKIPPED_HANDS["malformed"]
+        self.skippedLabel.setText(f"<h3 style=\"color: rgb(200, 0, 0); font-weight: normal;\">Skipped <b>{unrecognized}</b> files in an unrecognized format and <b>{malformed}</b> hands that couldn't be read</h3>")
+        self.skippedLabel.setVisible(bool(unrecognized or malformed))
 
 class BasicStats(QWidget):
     def __init__(self):
@@ -312,8 +394,8 @@ class BasicStats(QWidget):
         self.updateData()
 
     def calculate_dollar_per_100_hands(self):
-        if len(HANDS) > 0:
-            return round(PLAYER_STATS['cprofit'] / len(HANDS) * 100, 2)
+        if NUM_HANDS > 0:
+            return round(PLAYER_STATS['cprofit'] / NUM_HANDS * 100, 2)
         return 0.0
 
     def updateData(self):
@@ -334,21 +416,60 @@ class HandHist(QWidget):
         layout = QVBoxLayout()
         self.table = QTableWidget()
 
-        self.table.setRowCount(len(HANDS))
         self.table.setColumnCount(6) # Date, hole cards, community cards, win, profit, position
         self.table.setHorizontalHeaderLabels(["Date", "Hole Cards", "Community Cards", "Win?", "Profit", "Position"])
 
-        self.numHands = len(HANDS)
+        self.numHands = None
+        self.updateData()
 
-        for i, hand in enumerate(get_sorted_hands(HANDS)):
-            date = QTableWidgetItem(format_date_string(str(hand.date)))
-            hole = self.get_card_label(format_card_string(hand.hand))
-            community = self.get_card_label(format_card_string(hand.community))
-            win = QTableWidgetItem("Yes" if hand.won else "No")
-            profit_str = format_profit_value(hand.profit)
-            profit_str = f'<p style="color: red">{profit_str}</p>' if hand.profit < 0 else f'<p style="color: green">{profit_str}</p>' if hand.profit > 0 else profit_str
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.setSortingEnabled(True)
+        self.table.setAlternatingRowColors(True)
+        self.table.setShowGrid(False)
+        self.table.cellDoubleClicked.connect(self.openHandDetail)
+        self.table.verticalScrollBar().valueChanged.connect(self.prefetchVisibleHands)
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def getRowHandId(self, row):
+        item = self.table.item(row, 0)
+        return item.data(Qt.ItemDataRole.UserRole) if item else None
+
+    def openHandDetail(self, row, column):
+        handId = self.getRowHandId(row)
+        if handId is None: return
+        self.detail = HandDetail(handId, HAND_TEXT_CACHE.get(handId))
+        self.detail.show()
+
+    def prefetchVisibleHands(self):
+        first = self.table.rowAt(0)
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if first < 0: return
+        if last < 0: last = self.table.rowCount() - 1
+        rows = range(max(0, first - PREFETCH_ROWS), min(self.table.rowCount(), last + PREFETCH_ROWS + 1))
+        HAND_TEXT_CACHE.prefetch([self.getRowHandId(row) for row in rows])
+
+    def get_card_label(self, card_str):
+        card_str = card_str.replace("♦", "<span style=\"color: red\">♦</span>")
+        card_str = card_str.replace("♥", "<span style=\"color: red\">♥</span>")
+        return QLabel(f'<p>{card_str}</p>')
+    
+    def setRows(self, rows):
+        self.table.setSortingEnabled(False)
+        self.table.clearContents()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            date = QTableWidgetItem(format_date_string(row["date"]))
+            date.setData(Qt.ItemDataRole.UserRole, row["id"])
+            hole = self.get_card_label(format_card_string(row["hand"]))
+            community = self.get_card_label(format_card_string(row["community"]))
+            win = QTableWidgetItem("Yes" if row["won"] else "No")
+            profit_str = format_profit_value(row["profit"])
+            profit_str = f'<p style="color: red">{profit_str}</p>' if row["profit"] < 0 else f'<p style="color: green">{profit_str}</p>' if row["profit"] > 0 else profit_str
             profit = QLabel(profit_str)
-            position = QTableWidgetItem(hand.position)
+            position = QTableWidgetItem(row["position"])
 
             self.table.setItem(i, 0, date)
             self.table.setCellWidget(i, 1, hole)
@@ -356,42 +477,88 @@ class HandHist(QWidget):
             self.table.setItem(i, 3, win)
             self.table.setCellWidget(i, 4, profit)
             self.table.setItem(i, 5, position)
+        self.table.setSortingEnabled(True)
+
+    def updateData(self):
+        if self.numHands != len(HANDS):
+            self.numHands = len(HANDS)
+            self.setRows(get_table_rows(HANDS) if HANDS else TABLE_HEAD)
+
+class SessionList(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.init()
+
+    def init(self):
+        layout = QVBoxLayout()
+        self.table = QTableWidget()
+
+        self.table.setColumnCount(9)
+        self.table.setHorizontalHeaderLabels(["Start", "Duration", "Hands", "Hands/Hour", "Net", "BB/100", "Peak", "Trough", "Tables"])
+
+        self.numSessions = 0
+        self.revision = None
+        self.updateData()
 
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.table.setSortingEnabled(True)
         self.table.setAlternatingRowColors(True)
         self.table.setShowGrid(False)
 
         layout.addWidget(self.table)
         self.setLayout(layout)
 
-    def get_card_label(self, card_str):
-        card_str = card_str.replace("♦", "<span style=\"color: red\">♦</span>")
-        card_str = card_str.replace("♥", "<span style=\"color: red\">♥</span>")
-        return QLabel(f'<p>{card_str}</p>')
-    
     def updateData(self):
-        if self.numHands != len(HANDS):
-            self.numHands = len(HANDS)
-            self.table.clear()
-            self.table.setRowCount(len(HANDS))
-            for i, hand in enumerate(get_sorted_hands(HANDS)):
-                date = QTableWidgetItem(format_date_string(str(hand.date)))
-                hole = self.get_card_label(format_card_string(hand.hand))
-                community = self.get_card_label(format_card_string(hand.community))
-                win = QTableWidgetItem("Yes" if hand.won else "No")
-                profit_str = format_profit_value(hand.profit)
-                profit_str = f'<p style="color: red">{profit_str}</p>' if hand.profit < 0 else f'<p style="color: green">{profit_str}</p>' if hand.profit > 0 else profit_str
-                profit = QLabel(profit_str)
-                position = QTableWidgetItem(hand.position)
-
-                self.table.setItem(i, 0, date)
-                self.table.setCellWidget(i, 1, hole)
-                self.table.setCellWidget(i, 2, community)
-                self.table.setItem(i, 3, win)
-                self.table.setCellWidget(i, 4, profit)
-                self.table.setItem(i, 5, position)
+        revision = SESSION_TRACKER.revision
+        if revision == self.revision: return
+
+        if self.revision is None or SESSION_TRACKER.regroup_revision > self.revision:
+            # the sessions were regrouped, so every row may have changed
+            self.table.clearContents()
+            self.table.setRowCount(len(SESSIONS))
+            changedRows = len(SESSIONS)
+        else:
+            # only new sessions were added, and only the previously newest one can have grown
+            newSessions = len(SESSIONS) - self.numSessions
+            for _ in range(newSessions):
+                self.table.insertRow(0)
+            changedRows = min(newSessions + 1, len(SESSIONS))
+
+        self.revision = revision
+        self.numSessions = len(SESSIONS)
+        for i in range(changedRows):
+            self.setRow(i, SESSIONS[-1 - i])
+
+    def setRow(self, i, session):
+        values = [
+            format_date_string(str(session.start)),
+            format_duration(session.get_duration()),
+            str(session.num_hands),
+            str(round(session.get_hands_per_hour(), 1)),
+            format_profit_value(session.net),
+            str(round(session.get_bb_per_100(), 2)),
+            format_profit_value(session.peak),
+            format_profit_value(session.trough),
+            ", ".join(f"{table} ({result['hands']} hands, {format_profit_value(result['net'])})" for table, result in session.tables.items()),
+        ]
+        for j, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            item.setToolTip(value)
+            self.table.setItem(i, j, item)
+
+class HandDetail(QWidget):
+    def __init__(self, handId, text):
+        super().__init__()
+        self.setWindowTitle(f'Hand #{handId}')
+        self.setMinimumSize(600, 500)
+
+        layout = QVBoxLayout()
+        self.textView = QPlainTextEdit()
+        self.textView.setReadOnly(True)
+        self.textView.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.SystemFont.FixedFont))
+        self.textView.setPlainText(text if text is not None else f"The text for hand #{handId} could not be found.")
+        layout.addWidget(self.textView)
+        self.setLayout(layout)
 
 def isConfigValid():
     try:
@@ -410,6 +577,7 @@ def isConfigValid():
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     app.setWindowIcon(QtGui.QIcon('resources/logo.png'))
+    load_startup_snapshot()
     main = Main()
     main.customShow()
     sys.exit(app.exec())
\ No newline at end of file
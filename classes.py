@@ -1,33 +1,92 @@
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 import json
+import os
 import re
+from utils import decode_hand_text, get_sorted_hands
+
+# supported hand history formats, each with its own pattern file
+FORMATS = {
+    "default": './config/patterns.json',
+}
+
+class HandParser:
+    '''The compiled regex patterns of one hand history format, for one user.'''
+    def __init__(self, name, patterns, user):
+        self.name = name
+        self.user = user
+
+        # compiling regex strings
+        self.hand_split_pattern = re.compile(patterns["handSplit"].encode())
+        self.header_pattern = re.compile(patterns["header"])
+        self.button_pattern = re.compile(patterns["button"])
+        self.position_pattern = re.compile(f'{patterns["position"]} {user}')
+        self.blind_pattern = re.compile(f'{user} {patterns["blind"]}')
+        self.hand_pattern = re.compile(f'{patterns["hand"]["beforeUser"]} {user} {patterns["hand"]["afterUser"]}')
+        self.win_pattern = re.compile(f'{user} {patterns["win"]}')
+        self.call_pattern = re.compile(f'{user} {patterns["call"]}')
+        self.bet_pattern = re.compile(f'{user} {patterns["bet"]}')
+        self.raise_pattern = re.compile(f'{user} {patterns["raise"]}')
+        self.fold_pattern = re.compile(f'{user} {patterns["fold"]}')
+        self.dead_pattern = re.compile(f'{user} {patterns["dead"]}')
+        self.uncalled_pattern = re.compile(f'{patterns["uncalledBet"]} {user}')
+        self.community_pattern = re.compile(f'{patterns["community"]}')
+        self.table_pattern = re.compile(patterns["table"])
+        self.stakes_pattern = re.compile(patterns["stakes"])
+
+        # plain strings, not regex
+        self.date_format = patterns["dateFormat"]
+        self.summary_marker = patterns["summaryMarker"]
+        self.flop_marker = patterns["flopMarker"]
+
+    @classmethod
+    def from_file(cls, name, pattern_file, user):
+        with open(pattern_file, 'r') as file:
+            return cls(name, json.load(file), user)
+
+    def is_format_of(self, header_line):
+        '''Returns whether the first line of a hand history file is a header of this format.'''
+        return re.search(self.header_pattern, header_line) is not None
+
+    def parse_stakes(self, stakes):
+        '''Returns the (small blind, big blind) amounts of a stakes string from the header.'''
+        stakes = re.search(self.stakes_pattern, stakes)
+        return (float(stakes.group(1)), float(stakes.group(2)))
+
+    def parse(self, rawtext, source=None):
+        return Hand(rawtext, self.user, source, self)
 
 class Hand:
-    def __init__(self, rawtext, user):
+    def __init__(self, rawtext, user, source=None, parser=None):
         self.rawtext = rawtext
         self.user = user
+        # (file path, start byte, end byte) of the hand in its history file
+        self.source = source
+        self.parser = parser
         self.parse_raw_text()
+        # hands with a source can be re-read on demand, so the text isn't kept around
+        if source is not None:
+            self.rawtext = None
 
     def parse_raw_text(self):
         # get pattern data
-        pattern_file = './config/patterns.json'
-        with open(pattern_file, 'r') as file:
-            patterns = json.load(file)
-
-        # compiling regex strings
-        header_pattern = re.compile(patterns["header"])
-        button_pattern = re.compile(patterns["button"])
-        position_pattern = re.compile(f'{patterns["position"]} {self.user}')
-        blind_pattern = re.compile(f'{self.user} {patterns["blind"]}')
-        hand_pattern = re.compile(f'{patterns["hand"]["beforeUser"]} {self.user} {patterns["hand"]["afterUser"]}')
-        win_pattern = re.compile(f'{self.user} {patterns["win"]}')
-        call_pattern = re.compile(f'{self.user} {patterns["call"]}')
-        bet_pattern = re.compile(f'{self.user} {patterns["bet"]}')
-        raise_pattern = re.compile(f'{self.user} {patterns["raise"]}')
-        fold_pattern = re.compile(f'{self.user} {patterns["fold"]}')
-        dead_pattern = re.compile(f'{self.user} {patterns["dead"]}')
-        uncalled_pattern = re.compile(f'{patterns["uncalledBet"]} {self.user}')
-        community_pattern = re.compile(f'{patterns["community"]}')
+        if not self.parser:
+            self.parser = HandParser.from_file("default", FORMATS["default"], self.user)
+        parser = self.parser
+        header_pattern = parser.header_pattern
+        button_pattern = parser.button_pattern
+        position_pattern = parser.position_pattern
+        blind_pattern = parser.blind_pattern
+        hand_pattern = parser.hand_pattern
+        win_pattern = parser.win_pattern
+        call_pattern = parser.call_pattern
+        bet_pattern = parser.bet_pattern
+        raise_pattern = parser.raise_pattern
+        fold_pattern = parser.fold_pattern
+        dead_pattern = parser.dead_pattern
+        uncalled_pattern = parser.uncalled_pattern
+        community_pattern = parser.community_pattern
+        table_pattern = parser.table_pattern
 
         spent_amt = 0.0
 
@@ -36,6 +95,14 @@ class Hand:
         date = header.group(3)
         stakes = header.group(2)
         id = int(header.group(1))
+        stakes_pair = parser.parse_stakes(stakes)
+        self.big_blind = stakes_pair[1]
+
+        # get table, falling back to the file name since sites write one file per table
+        table = re.search(table_pattern, self.rawtext)
+        if table: self.table = table.group(1)
+        elif self.source: self.table = os.path.splitext(os.path.basename(self.source[0]))[0]
+        else: self.table = ""
 
         # get hand
         hand = re.search(hand_pattern, self.rawtext)
@@ -77,7 +144,7 @@ class Hand:
         win_amt = float(win.group(1)) if win_status else 0.
 
         # check vpip
-        pre_summary = self.rawtext.split("*** SUMMARY ***")[0]
+        pre_summary = self.rawtext.split(parser.summary_marker)[0]
         calls, bets, raises = 0, 0, 0
         for match in re.finditer(call_pattern, pre_summary):
             spent_amt += float(match.group(1))
@@ -96,7 +163,7 @@ class Hand:
         self.raises = raises
 
         # check fold before flop
-        pre_flop = self.rawtext.split("*** FLOP ***")
+        pre_flop = self.rawtext.split(parser.flop_marker)
         sf = re.search(fold_pattern, pre_flop[0]) == None
         if len(pre_flop) <= 1: sf = False
 
@@ -104,7 +171,6 @@ class Hand:
         pfr = re.search(raise_pattern, pre_flop[0]) == None
 
         # hand spending on deads and blinds
-        stakes_pair = (float(stakes.split('/')[0][1:]), float(stakes.split('/')[1][1:]))
         if position == "small blind": spent_amt += stakes_pair[0]
         elif position == "big blind": spent_amt += stakes_pair[1]
         dead = re.search(dead_pattern, self.rawtext)
@@ -141,7 +207,7 @@ class Hand:
 
     def parse_date(self, date_str):
         # Parse the date string to a datetime object
-        return datetime.strptime(date_str, "%Y/%m/%d %H:%M:%S %Z")
+        return datetime.strptime(date_str, self.parser.date_format)
 
     def set_date(self, date_str):
         self.date = self.parse_date(date_str)
@@ -150,5 +216,137 @@ class Hand:
         return f'__________Hand #{self.id} ({self.stakes})__________\nTimestamp: {self.date}\nPosition: {self.position}\nHand: {self.hand}\nWin: {"Yes" if self.won else "No"}\nNet: ${self.profit}'
     
     def get_profit_in_bb(self):
-        bb_amt = float(self.stakes.split('/')[1][1:])
-        return self.profit/bb_amt
\ No newline at end of file
+        return self.profit/self.big_blind
+
+class HandTextCache:
+    '''Size-bounded LRU cache of raw hand text. Text is read on demand from the source index (hand id -> (file path, start byte, end byte)).'''
+    def __init__(self, max_chars=2_000_000):
+        self.max_chars = max_chars
+        self.index = {}
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def set_index(self, index):
+        self.index = index
+        # drop cached text for hands that are no longer loaded
+        for hand_id in [hand_id for hand_id in self.entries if hand_id not in index]:
+            self.size -= len(self.entries.pop(hand_id))
+
+    def get(self, hand_id):
+        '''Returns the raw text of a hand, or None if the hand is not in the index.'''
+        if hand_id in self.entries:
+            self.entries.move_to_end(hand_id)
+            return self.entries[hand_id]
+        if hand_id not in self.index:
+            return None
+        path, start, end = self.index[hand_id]
+        try:
+            with open(path, 'rb') as file:
+                file.seek(start)
+                text = decode_hand_text(file.read(end - start))
+        except OSError as e:
+            print(f"Error reading hand #{hand_id} from {path}: {e}")
+            return None
+        self.put(hand_id, text)
+        return text
+
+    def prefetch(self, hand_ids):
+        '''Reads any uncached hands in hand_ids, opening each source file once.'''
+        by_file = {}
+        for hand_id in hand_ids:
+            if hand_id not in self.entries and hand_id in self.index:
+                path, start, end = self.index[hand_id]
+                by_file.setdefault(path, []).append((start, end, hand_id))
+
+        for path, ranges in by_file.items():
+            try:
+                with open(path, 'rb') as file:
+                    for start, end, hand_id in sorted(ranges):
+                        file.seek(start)
+                        self.put(hand_id, decode_hand_text(file.read(end - start)))
+            except OSError as e:
+                print(f"Error reading hands from {path}: {e}")
+
+    def put(self, hand_id, text):
+        if hand_id in self.entries:
+            self.size -= len(self.entries.pop(hand_id))
+        self.entries[hand_id] = text
+        self.size += len(text)
+        while self.size > self.max_chars and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class Session:
+    '''A run of hands where no two consecutive hands are further apart than the session gap.'''
+    def __init__(self, hand):
+        self.start = hand.date
+        self.end = hand.date
+        self.num_hands = 0
+        self.net = 0.
+        self.net_bb = 0.
+        self.peak = 0.
+        self.trough = 0.
+        # table -> {"hands": count, "net": profit}
+        self.tables = {}
+        self.add(hand)
+
+    def add(self, hand):
+        self.end = hand.date
+        self.num_hands += 1
+        self.net += hand.profit
+        self.net_bb += hand.get_profit_in_bb()
+        self.peak = max(self.peak, self.net)
+        self.trough = min(self.trough, self.net)
+        table = self.tables.setdefault(hand.table, {"hands": 0, "net": 0.})
+        table["hands"] += 1
+        table["net"] += hand.profit
+
+    def get_duration(self):
+        return self.end - self.start
+
+    def get_hands_per_hour(self):
+        hours = self.get_duration().total_seconds() / 3600
+        return self.num_hands / hours if hours > 0 else 0.
+
+    def get_bb_per_100(self):
+        return self.net_bb / self.num_hands * 100
+
+class SessionTracker:
+    '''Groups hands into sessions in one pass over time-sorted hands, and extends the sessions as new hands are parsed.'''
+    def __init__(self, gap=timedelta(minutes=30)):
+        self.gap = gap
+        self.sessions = []
+        self.hand_ids = set()
+        # increases whenever the sessions change; regroup_revision is the revision of the last full regroup
+        self.revision = 0
+        self.regroup_revision = 0
+
+    def update(self, hands):
+        '''Adds any hands that haven't been seen yet and returns the sessions, oldest first. Hands with the same id (e.g. from a copied history file) are only counted once.'''
+        unique_hands = {}
+        for hand in hands:
+            unique_hands.setdefault(hand.id, hand)
+        new_hands = [hand for hand_id, hand in unique_hands.items() if hand_id not in self.hand_ids]
+        new_hands = get_sorted_hands(new_hands, reverse=False)
+
+        # only hands newer than the last session can be added in place, anything else means regrouping everything
+        removed = len(unique_hands) - len(new_hands) != len(self.hand_ids)
+        if removed or (self.sessions and new_hands and new_hands[0].date < self.sessions[-1].end):
+            self.sessions = []
+            self.hand_ids = set()
+            self.revision += 1
+            self.regroup_revision = self.revision
+            new_hands = get_sorted_hands(unique_hands.values(), reverse=False)
+
+        for hand in new_hands:
+            self.add(hand)
+        return self.sessions
+
+    def add(self, hand):
+        if not self.sessions or hand.date - self.sessions[-1].end > self.gap:
+            self.sessions.append(Session(hand))
+        else:
+            self.sessions[-1].add(hand)
+        self.hand_ids.add(hand.id)
+        self.revision += 1
@@ -0,0 +1,207 @@
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from classes import Hand
+from reader import get_text_files, get_parsers, get_file_parser, split_hand_text
+
+# every field a parsed hand exposes, compared between the reference and each candidate parser
+FIELDS = ['id', 'date', 'position', 'stakes', 'hand', 'table', 'won', 'vpip', 'saw_flop', 'money_spent',
+          'money_won', 'profit', 'calls', 'bets', 'raises', 'pfr', 'community']
+
+STAKES = [(0.01, 0.02), (0.02, 0.05), (0.05, 0.10), (0.10, 0.25), (0.25, 0.50), (1.00, 2.00)]
+RANKS = '23456789TJQKA'
+SUITS = 'cdhs'
+
+# anonymised hands in the site's export format, always included as a recorded corpus
+SAMPLE_HANDS_DIR = './resources/sample_hands'
+SAMPLE_HANDS_USER = 'Hero'
+
+def parse_reference(text, user):
+    '''The reference semantics: Hand.parse_raw_text with the pattern file loaded for every hand.'''
+    return Hand(text, user)
+
+def get_compiled_parser():
+    '''Parses with a HandParser compiled once per user, the way get_hand_list does.'''
+    parsers = {}
+    def parse(text, user):
+        if user not in parsers:
+            parsers[user] = get_parsers(user)[0]
+        return parsers[user].parse(text)
+    return parse
+
+# candidate parsers checked against the reference; add a new parser here to check it
+PARSERS = {
+    "compiled": get_compiled_parser,
+}
+
+def generate_hand(rng, hand_id, user, date):
+    '''Returns the text of a random hand covering blinds, dead money, raises, uncalled bets and sitting out.'''
+    sb, bb = rng.choice(STAKES)
+    seats = rng.randint(2, 6)
+    user_seat = rng.randint(1, seats)
+    button = rng.randint(1, seats)
+    deck = [r + s for r in RANKS for s in SUITS]
+    rng.shuffle(deck)
+    money = lambda amt: f'${amt:.2f}'
+
+    lines = [
+        f'Hand #{hand_id} - Holdem(No Limit) - {money(sb)}/{money(bb)} - {date.strftime("%Y/%m/%d %H:%M:%S")} UTC',
+        f"Table 'Generated {rng.randint(1, 20)}' {seats}-max Seat #{button} is the button",
+    ]
+    for seat in range(1, seats + 1):
+        name = user if seat == user_seat else f'villain{seat}'
+        lines.append(f'Seat {seat}: {name} ({money(rng.randint(50, 300) * bb)} in chips)')
+
+    blind = rng.choice(['small', 'big', None, None])
+    if blind:
+        lines.append(f'{user} posts the {blind} blind {money(sb if blind == "small" else bb)}')
+    if rng.random() < 0.1:
+        lines.append(f'{user} posts dead {money(sb)}')
+
+    lines.append('*** HOLE CARDS ***')
+    if rng.random() < 0.1:
+        lines.append(f'{user} is sitting out')
+    else:
+        lines.append(f'Dealt to {user} [{deck[0]} {deck[1]}]')
+
+    streets = [('*** FLOP ***', deck[2:5]), ('*** TURN ***', deck[5:6]), ('*** RIVER ***', deck[6:7])]
+    pot = sb + bb
+    folded, villain_folds = False, False
+    last_bet = 0.
+    board = []
+    for street in range(4):
+        if street > 0:
+            name, cards = streets[street - 1]
+            board.extend(cards)
+            lines.append(f'{name} [{" ".join(board)}]')
+        action = rng.choice(['fold', 'call', 'bet', 'raise', 'check'])
+        amt = round(rng.randint(1, 10) * bb, 2)
+        if action == 'fold':
+            lines.append(f'{user} folds')
+            folded = True
+        elif action == 'call':
+            lines.append(f'{user} calls {money(amt)}')
+        elif action == 'bet':
+            lines.append(f'{user} bets {money(amt)}')
+        elif action == 'raise':
+            lines.append(f'{user} raises {money(amt)} to {money(round(amt + bb, 2))}')
+        else:
+            lines.append(f'{user} checks')
+        last_bet = amt if action in ('bet', 'raise') else 0.
+        pot = round(pot + amt * 2, 2)
+        villain_folds = rng.random() < 0.3
+        lines.append(f'villain{(user_seat % seats) + 1} {"folds" if villain_folds else "calls " + money(amt)}')
+        if folded or villain_folds or rng.random() < 0.3:
+            break
+
+    if last_bet and not folded and rng.random() < 0.5:
+        lines.append(f'Uncalled bet ({money(last_bet)}) returned to {user}')
+
+    lines.append('*** SUMMARY ***')
+    if board:
+        lines.append(f'Board [{" ".join(board)}]')
+    if not folded and (villain_folds or rng.random() < 0.5):
+        lines.append(f'Seat {user_seat}: {user} showed [{deck[0]} {deck[1]}] and won {money(pot)}')
+    elif not folded:
+        lines.append(f'Seat {user_seat}: {user} showed [{deck[0]} {deck[1]}] and lost')
+    else:
+        lines.append(f'Seat {user_seat}: {user} folded on the Pre-Flop')
+
+    return '\n'.join(lines)
+
+def get_generated_corpus(count, seed=0, user='hero'):
+    '''Returns count generated (hand text, user) pairs.'''
+    rng = random.Random(seed)
+    date = datetime(2024, 1, 1)
+    corpus = []
+    for hand_id in range(1, count + 1):
+        date += timedelta(seconds=rng.randint(20, 4000))
+        corpus.append((generate_hand(rng, hand_id, user, date), user))
+    return corpus
+
+def get_recorded_corpus(dirs, user):
+    '''Returns the (hand text, user) pairs of every hand in the hand history files in dirs.'''
+    parsers = get_parsers(user)
+    corpus = []
+    for file_path, data in get_text_files(dirs):
+        parser = get_file_parser(data, parsers)
+        if parser is None: continue
+        corpus.extend((text, user) for text, start, end in split_hand_text(data, parser.hand_split_pattern))
+    return corpus
+
+def get_result(parse, text, user):
+    '''Returns every field of the parsed hand, or the error type if parsing fails.'''
+    try:
+        hand = parse(text, user)
+    except Exception as e:
+        return ('error', type(e).__name__)
+    return tuple(getattr(hand, field, None) for field in FIELDS)
+
+def time_parser(parse, corpus, repeat):
+    '''Returns the best time in seconds of repeat runs of parse over the corpus.'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text, user in corpus:
+            try:
+                parse(text, user)
+            except Exception:
+                pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_harness(corpus, parsers, repeat=3, min_speedup=1.05):
+    '''Compares every candidate parser with the reference over the corpus and prints their throughput. Returns whether every candidate matched the reference and was at least min_speedup times faster.'''
+    num_bytes = sum(len(text.encode()) for text, user in corpus)
+    expected = [get_result(parse_reference, text, user) for text, user in corpus]
+    reference_time = time_parser(parse_reference, corpus, repeat)
+    print(f'{"reference":<12} {len(corpus) / reference_time:>12.0f} hands/s {num_bytes / reference_time / 1e6:>8.2f} MB/s')
+
+    accepted = True
+    for name, get_parser in parsers.items():
+        parse = get_parser()
+        mismatches = 0
+        for (text, user), reference in zip(corpus, expected):
+            result = get_result(parse, text, user)
+            if result != reference:
+                if mismatches < 5:
+                    print(f'{name}: mismatch in hand {text.splitlines()[0]!r}')
+                    if reference[0] == 'error' or result[0] == 'error':
+                        print(f'  reference: {reference}\n  {name}: {result}')
+                    else:
+                        for field, a, b in zip(FIELDS, reference, result):
+                            if a != b: print(f'  {field}: reference {a!r}, {name} {b!r}')
+                mismatches += 1
+
+        elapsed = time_parser(parse, corpus, repeat)
+        speedup = reference_time / elapsed
+        print(f'{name:<12} {len(corpus) / elapsed:>12.0f} hands/s {num_bytes / elapsed / 1e6:>8.2f} MB/s {speedup:>6.2f}x {mismatches} mismatches')
+        if mismatches or speedup < min_speedup:
+            accepted = False
+
+    return accepted
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Checks that candidate hand parsers give the same results as Hand.parse_raw_text and compares their speed.')
+    arg_parser.add_argument('dirs', nargs='*', help='more hand history directories to use as a recorded corpus')
+    arg_parser.add_argument('--user', help='username in the recorded hands (defaults to the configured user)')
+    arg_parser.add_argument('--generated', type=int, default=2000, help='how many hands to generate')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--repeat', type=int, default=3, help='how many timed runs to take the best of')
+    arg_parser.add_argument('--min-speedup', type=float, default=1.05, help='how much faster than the reference a parser must be')
+    args = arg_parser.parse_args()
+
+    corpus = get_generated_corpus(args.generated, args.seed)
+    corpus.extend(get_recorded_corpus([SAMPLE_HANDS_DIR], SAMPLE_HANDS_USER))
+    if args.dirs:
+        user = args.user
+        if not user:
+            with open('./config/config.json', 'r') as file:
+                user = json.load(file)['user']
+        corpus.extend(get_recorded_corpus(args.dirs, user))
+
+    print(f'{len(corpus)} hands')
+    sys.exit(0 if run_harness(corpus, PARSERS, args.repeat, args.min_speedup) else 1)
@@ -1,53 +1,89 @@
 import json
 import os
 import re
-from numpy import mean, sort
-from classes import Hand
+from classes import HandParser, FORMATS
+from utils import decode_hand_text, get_sorted_hands
 import csv
-import matplotlib.pyplot as plt
 
-# get pattern data
-pattern_file = './config/patterns.json'
-with open(pattern_file, 'r') as file:
-    patterns = json.load(file)
+SNAPSHOT_ROWS = 100 # how many of the newest hands are kept in the startup snapshot
+SNAPSHOT_POINTS = 1000 # max points of the cumulative profit graph kept in the startup snapshot
 
 def get_text_files(dirs):
-    all_files = []
-
+    '''Yields a (file path, file bytes) pair for every hand history file in dirs, reading one file at a time.'''
     for dir in dirs:
         if not os.path.isdir(dir):
             print(f"Error: The directory {dir} does not exist.")
             exit()
 
         text_files = [f for f in os.listdir(dir) if f.endswith('.txt')]
-        text_file_data = []
 
         for file_name in text_files:
             file_path = os.path.join(dir, file_name)
             try:
-                with open(file_path, 'r') as file:
-                    text_file_data.append(file.read()[:-2])
+                with open(file_path, 'rb') as file:
+                    data = file.read()
             except Exception as e:
                 print(f"Error reading file {file_name}: {e}")
-
-        all_files.extend(text_file_data)
-
-    return all_files
-
-def get_hand_list(sessions, user, include_sitting_out=False):
-    hand_split_pattern = re.compile(patterns["handSplit"])
+                continue
+            yield file_path, data
+
+def get_parsers(user):
+    '''Returns a compiled parser for every supported hand history format.'''
+    return [HandParser.from_file(name, pattern_file, user) for name, pattern_file in FORMATS.items()]
+
+def get_file_parser(data, parsers):
+    '''Returns the parser whose header matches the first line of a hand history file, or None if no format matches.'''
+    header_line = decode_hand_text(data[:1024]).lstrip('\ufeff').lstrip().split('\n', 1)[0]
+    for parser in parsers:
+        if parser.is_format_of(header_line):
+            return parser
+    return None
+
+def split_hand_text(data, hand_split_pattern):
+    '''Yields (hand text, start byte, end byte) for every hand in the bytes of a hand history file.'''
+    splits = list(re.finditer(hand_split_pattern, data))
+    starts = [0] + [match.end() for match in splits]
+    stops = [match.start() for match in splits] + [len(data)]
+
+    for start, stop in zip(starts, stops):
+        chunk = data[start:stop].rstrip()
+        if chunk:
+            yield decode_hand_text(chunk), start, start + len(chunk)
+
+def get_hand_list(sessions, user, include_sitting_out=False, skipped=None):
+    '''Parses every hand in the hand history files. Files in an unknown format and hands that can't be parsed are skipped, and counted in skipped (if given) as "unrecognized_files" and "malformed".'''
+    parsers = get_parsers(user)
     all_hands = []
+    unrecognized, malformed = 0, 0
+
+    for file_path, data in sessions:
+        parser = get_file_parser(data, parsers)
+        if parser is None:
+            unrecognized += 1
+            continue
 
-    for session in sessions:
-        hands = re.split(hand_split_pattern, session)
-        for hand in hands:
-            new_hand = Hand(hand, user)
+        for text, start, end in split_hand_text(data, parser.hand_split_pattern):
+            try:
+                new_hand = parser.parse(text, source=(file_path, start, end))
+            except (AttributeError, IndexError, ValueError):
+                malformed += 1
+                continue
             if new_hand.position != "sitting out" or include_sitting_out:
                 all_hands.append(new_hand)
 
+    if skipped is not None:
+        skipped["unrecognized_files"] = skipped.get("unrecognized_files", 0) + unrecognized
+        skipped["malformed"] = skipped.get("malformed", 0) + malformed
+
     return all_hands
 
+def get_source_index(hands):
+    '''Returns a dict mapping each hand id to where its raw text lives (file path, start byte, end byte).'''
+    return {hand.id: hand.source for hand in hands if hand.source is not None}
+
 def get_player_stats(hands):
+    from numpy import mean
+
     stats = {
         "vpip": 0.,
         "best_hand": "",
@@ -109,7 +145,68 @@ def save_hands_to_csv(hands, filename='hands_chronological.csv'):
 
     print(f'Hands saved to {filename} successfully.')
 
+def get_cumulative_profits(hands):
+    '''Returns the x (hand number) and y (cumulative profit) values of the cumulative profit graph.'''
+    x = list(range(1, len(hands) + 1))
+    y = []
+    cumulative_profit = 0
+    for hand in hands:
+        cumulative_profit += hand.profit
+        y.append(cumulative_profit)
+    return x, y
+
+def get_table_rows(hands, limit=None):
+    '''Returns the newest hands as rows for the hands table.'''
+    rows = []
+    for hand in get_sorted_hands(hands)[:limit]:
+        rows.append({
+            "id": hand.id,
+            "date": str(hand.date),
+            "hand": hand.hand,
+            "community": hand.community,
+            "won": hand.won,
+            "profit": hand.profit,
+            "position": hand.position
+        })
+    return rows
+
+def save_snapshot(hands, stats, user, dirs, filename='./config/snapshot.json'):
+    '''Saves a small summary of the hands that the app can draw on startup before the hands are parsed.'''
+    x, y = get_cumulative_profits(hands)
+    step = -(-len(x) // SNAPSHOT_POINTS) if x else 1
+    keep = list(range(0, len(x), step))
+    if x and keep[-1] != len(x) - 1: keep.append(len(x) - 1)
+
+    snapshot = {
+        "user": user,
+        "handHistoryDirs": dirs,
+        "numHands": len(hands),
+        "stats": {**stats, "earliest_hand": str(stats["earliest_hand"])},
+        "profits": [[x[i] for i in keep], [y[i] for i in keep]],
+        "tableHead": get_table_rows(hands, SNAPSHOT_ROWS)
+    }
+
+    try:
+        with open(filename, 'w') as file:
+            json.dump(snapshot, file)
+    except OSError as e:
+        print(f"Error saving snapshot to {filename}: {e}")
+
+def load_snapshot(user, dirs, filename='./config/snapshot.json'):
+    '''Returns the saved snapshot, or None if there is none or it was saved for a different user or directories.'''
+    try:
+        with open(filename, 'r') as file:
+            snapshot = json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    if snapshot.get("user") != user or snapshot.get("handHistoryDirs") != dirs:
+        return None
+    return snapshot
+
 def plot_cumulative_profit(hands, savefig=False):
+    import matplotlib.pyplot as plt
+
     hands_sorted = sorted(hands, key=lambda x: x.date)
     
     profits = [hand.profit for hand in hands_sorted]
@@ -34,6 +34,10 @@ def format_card_string(string):
     s = " "
     return s.join(formatted_cards)
 
+def decode_hand_text(data):
+    '''Decodes raw hand history bytes into text with the same newlines as reading the file in text mode.'''
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n')
+
 def get_sorted_hands(hands, reverse=True):
     '''Returns the list of hands sorted based on date.'''
     return sorted(hands, key=lambda hand: hand.date, reverse=reverse)
@@ -43,6 +47,11 @@ def format_profit_value(profit):
     profit = round(profit, 2)
     return f'-${abs(profit)}' if profit < 0 else f'${profit}'
 
+def format_duration(duration):
+    '''Takes a timedelta and formats it in hours and minutes.'''
+    minutes = int(duration.total_seconds() // 60)
+    return f'{minutes // 60}h {minutes % 60}m'
+
 def format_date_string(date_str):
     '''Takes a date string and formats it in an easy to read way.'''
     input_date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")